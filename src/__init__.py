@@ -3,11 +3,13 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
 import os
 from dotenv import load_dotenv
+from .routing import RoutingSession, replica_binds, remember_last_write, sync_replicas
 
 load_dotenv()
 
 
-db = SQLAlchemy()
+# RoutingSession sends queries of read-only routes to replicas (if configured)
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 def create_app():
     app = Flask(__name__)
@@ -18,8 +20,23 @@ def create_app():
     app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL')
     # Not to have errors and for memory save
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    # Optional read replicas, comma separated
+    app.config['SQLALCHEMY_BINDS'] = replica_binds(os.getenv('DATABASE_REPLICA_URLS'))
+    # For how many seconds after a write the user reads from the primary only
+    app.config['DB_REPLICA_LAG_TOLERANCE'] = float(os.getenv('DATABASE_REPLICA_LAG', '5'))
+    # Where attachments are stored and the biggest upload we accept
+    app.config['UPLOAD_FOLDER'] = os.getenv('UPLOAD_FOLDER', os.path.join(app.instance_path, 'uploads'))
+    app.config['MAX_CONTENT_LENGTH'] = int(os.getenv('MAX_UPLOAD_MB', '20')) * 1024 * 1024
 
     db.init_app(app)
+    app.after_request(remember_last_write)
+    app.cli.add_command(sync_replicas)
+
+    # Attachment storage - swap LocalBlobStore for another BlobStore (e.g. S3) here
+    from .storage import LocalBlobStore, ThumbnailWorker
+    blob_store = LocalBlobStore(app.config['UPLOAD_FOLDER'])
+    app.extensions['blob_store'] = blob_store
+    app.extensions['thumbnail_worker'] = ThumbnailWorker(blob_store, app.logger)
 
     login_manager = LoginManager()
     login_manager.login_view = 'auth.login'
@@ -40,6 +57,15 @@ def create_app():
     from .main import main_bp
     app.register_blueprint(main_bp)
 
+    from .analytics import rollup_analytics
+    app.cli.add_command(rollup_analytics)
+
+    from .archive import archive_projects
+    app.cli.add_command(archive_projects)
+
+    from .upgrade import upgrade_db
+    app.cli.add_command(upgrade_db)
+
     return app
 
 
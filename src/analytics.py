@@ -0,0 +1,209 @@
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta
+
+import click
+from flask.cli import with_appcontext
+
+from . import db
+from .models import (Offer, Application, Rating, ArchivedOffer, ArchivedApplication, ArchivedRating,
+                     DailyStat, RollupState, RollupDirtyDay)
+
+STATE_NAME = 'analytics'
+# Rows committed shortly before the previous run may have been missed - look back a bit
+WATERMARK_OVERLAP = timedelta(minutes=5)
+
+METRICS = ('offers_created', 'offers_approved', 'applications_created',
+           'applications_accepted', 'ratings_count', 'ratings_sum')
+
+# (offer, application, rating) models the rollups are computed from.
+# Archived rows still count when a day is recomputed.
+ROLLUP_SOURCES = [(Offer, Application, Rating),
+                  (ArchivedOffer, ArchivedApplication, ArchivedRating)]
+
+
+def _as_date(value):
+    # func.date() gives a string on SQLite and a date on PostgreSQL
+    if isinstance(value, str):
+        return date.fromisoformat(value)
+    return value
+
+
+def _day_start(day):
+    return datetime.combine(day, time.min)
+
+
+def _ranges(days):
+    """Group sorted days into (first, last) ranges of consecutive days, so each range is one query."""
+    ranges = []
+    for day in days:
+        if ranges and day - ranges[-1][1] == timedelta(days=1):
+            ranges[-1][1] = day
+        else:
+            ranges.append([day, day])
+    return ranges
+
+
+def mark_dirty(*moments):
+    """Remember days whose stats have to be recomputed because rows are being deleted."""
+    for moment in moments:
+        if moment is not None:
+            db.session.merge(RollupDirtyDay(day=moment.date()))
+
+
+def _changed_days(since):
+    """Days touched by rows changed after `since` (or all days if since is None)."""
+    queries = []
+    for offer_model, application_model, rating_model in ROLLUP_SOURCES:
+        for column, changed in ((offer_model.date_created, offer_model.updated_at),
+                                (offer_model.date_approved, offer_model.updated_at),
+                                (application_model.date_created, application_model.updated_at),
+                                (rating_model.date_created, rating_model.date_created)):
+            query = db.select(db.func.date(column)).where(column.is_not(None)).distinct()
+            if since is not None:
+                query = query.where(changed > since)
+            queries.append(query)
+
+        if since is not None:
+            # Applications and ratings count for their offer's project - when the offer changes
+            # (e.g. is moved to another project), their days have to be recomputed too
+            queries.append(
+                db.select(db.func.date(application_model.date_created))
+                .join(offer_model, application_model.offer_id == offer_model.id)
+                .where(offer_model.updated_at > since).distinct()
+            )
+            queries.append(
+                db.select(db.func.date(rating_model.date_created))
+                .join(application_model, rating_model.application_id == application_model.id)
+                .join(offer_model, application_model.offer_id == offer_model.id)
+                .where(offer_model.updated_at > since, rating_model.date_created.is_not(None)).distinct()
+            )
+
+    days = set()
+    for query in queries:
+        days.update(_as_date(day) for day in db.session.scalars(query))
+    return days
+
+
+def _add(counts, rows, *metrics):
+    for row in rows:
+        key = (_as_date(row[0]), row[1])
+        for metric, value in zip(metrics, row[2:]):
+            counts[key][metric] += int(value or 0)
+
+
+def _compute(ranges):
+    """Stats per (day, project_id) for the given day ranges, with grouped queries."""
+    counts = defaultdict(lambda: dict.fromkeys(METRICS, 0))
+
+    for first, last in ranges:
+        start, end = _day_start(first), _day_start(last + timedelta(days=1))
+
+        for offer_model, application_model, rating_model in ROLLUP_SOURCES:
+            for column, metric in ((offer_model.date_created, 'offers_created'),
+                                   (offer_model.date_approved, 'offers_approved')):
+                day = db.func.date(column)
+                _add(counts, db.session.execute(
+                    db.select(day, offer_model.project_id, db.func.count(offer_model.id))
+                    .where(column >= start, column < end)
+                    .group_by(day, offer_model.project_id)
+                ), metric)
+
+            day = db.func.date(application_model.date_created)
+            _add(counts, db.session.execute(
+                db.select(day, offer_model.project_id, db.func.count(application_model.id),
+                          db.func.sum(db.case((application_model.status == 'accepted', 1), else_=0)))
+                .join(offer_model, application_model.offer_id == offer_model.id)
+                .where(application_model.date_created >= start, application_model.date_created < end)
+                .group_by(day, offer_model.project_id)
+            ), 'applications_created', 'applications_accepted')
+
+            day = db.func.date(rating_model.date_created)
+            _add(counts, db.session.execute(
+                db.select(day, offer_model.project_id, db.func.count(rating_model.id), db.func.sum(rating_model.score))
+                .join(application_model, rating_model.application_id == application_model.id)
+                .join(offer_model, application_model.offer_id == offer_model.id)
+                .where(rating_model.date_created >= start, rating_model.date_created < end)
+                .group_by(day, offer_model.project_id)
+            ), 'ratings_count', 'ratings_sum')
+
+    return counts
+
+
+def run_rollup(full=False):
+    """Bring daily_stats up to date.
+
+    Only days touched by rows changed since the last run are recomputed, so a
+    run costs as much as the recent activity, not the size of the tables.
+    Returns the number of recomputed days.
+    """
+    started = datetime.utcnow()
+    state = db.session.get(RollupState, STATE_NAME)
+    if state is None:
+        state = RollupState(name=STATE_NAME)
+        db.session.add(state)
+
+    full = full or state.watermark is None
+    dirty = db.session.scalars(db.select(RollupDirtyDay.day)).all()
+
+    days = _changed_days(None if full else state.watermark - WATERMARK_OVERLAP)
+    days.update(dirty)
+
+    if full:
+        db.session.execute(db.delete(DailyStat))
+    else:
+        for first, last in _ranges(sorted(days)):
+            db.session.execute(db.delete(DailyStat).where(DailyStat.day >= first, DailyStat.day <= last))
+
+    for (day, project_id), values in _compute(_ranges(sorted(days))).items():
+        db.session.add(DailyStat(day=day, project_id=project_id, **values))
+
+    if dirty:
+        db.session.execute(db.delete(RollupDirtyDay).where(RollupDirtyDay.day.in_(dirty)))
+    state.watermark = started
+    db.session.commit()
+    return len(days)
+
+
+@click.command('rollup-analytics')
+@click.option('--full', is_flag=True, help='Recompute all days instead of only the changed ones.')
+@with_appcontext
+def rollup_analytics(full):
+    """Update the daily analytics rollups. Meant to be run periodically (e.g. cron every few minutes)."""
+    count = run_rollup(full=full)
+    click.echo(f'Recomputed {count} day(s).')
+
+
+def _sums():
+    return [db.func.sum(getattr(DailyStat, metric)).label(metric) for metric in METRICS]
+
+
+def weekly_stats(weeks=12):
+    """Totals per week (Monday) for the last `weeks` weeks, oldest first."""
+    # UTC, like every timestamp the days are taken from
+    today = datetime.utcnow().date()
+    first_week = today - timedelta(days=today.weekday(), weeks=weeks - 1)
+
+    rows = db.session.execute(
+        db.select(DailyStat.day, *_sums())
+        .where(DailyStat.day >= first_week)
+        .group_by(DailyStat.day)
+    ).all()
+
+    result = {first_week + timedelta(weeks=i): dict.fromkeys(METRICS, 0) for i in range(weeks)}
+    for row in rows:
+        day = _as_date(row.day)
+        week = day - timedelta(days=day.weekday())
+        if week not in result:
+            # Rows dated after "today" (e.g. clock skew between hosts) aren't part of the window
+            continue
+        for metric in METRICS:
+            result[week][metric] += row._mapping[metric] or 0
+    return [dict(week=week, **values) for week, values in sorted(result.items())]
+
+
+def project_stats():
+    """All-time totals per project."""
+    rows = db.session.execute(
+        db.select(DailyStat.project_id, *_sums()).group_by(DailyStat.project_id)
+    ).all()
+    return [dict(row._mapping) for row in rows]
@@ -0,0 +1,124 @@
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy.exc import SQLAlchemyError
+
+from . import db
+from .models import (Project, Offer, Application, Rating, Attachment, ArchivedProject, ArchivedOffer,
+                     ArchivedApplication, ArchivedRating, ArchivedAttachment)
+
+BATCH_SIZE = 100
+
+
+def _copy(live_model, archive_model, condition):
+    """Copy the rows matching `condition` to the archive table with one INSERT ... SELECT."""
+    table = live_model.__table__
+    columns = [column.name for column in table.columns]
+    db.session.execute(
+        db.insert(archive_model.__table__).from_select(columns, db.select(*table.columns).where(condition))
+    )
+
+
+def _delete(live_model, condition):
+    db.session.execute(db.delete(live_model.__table__).where(condition))
+
+
+def _lock(model, condition):
+    """Ids of the matching rows, locked until commit (PostgreSQL).
+
+    Inserting a row that references a locked row (foreign key) waits for our
+    commit, so no rating or attachment can be added under us.
+    """
+    return list(db.session.scalars(db.select(model.id).where(condition).order_by(model.id).with_for_update()))
+
+
+def _archive_batch(project_ids, offer_ids):
+    # Lock parents before children - everything hanging on the projects/offers goes with them
+    project_ids = _lock(Project, Project.id.in_(project_ids))
+    offer_ids = _lock(Offer, db.or_(Offer.id.in_(offer_ids), Offer.project_id.in_(project_ids)))
+    if not offer_ids and not project_ids:
+        db.session.rollback()
+        return 0
+    _lock(Application, Application.offer_id.in_(offer_ids))
+
+    # Children are matched by their parents, not by ids read earlier. SQLite ignores FOR UPDATE,
+    # but the first INSERT takes its write lock, so copy and delete still see the same rows.
+    of_projects = Project.id.in_(project_ids)
+    of_offers = Offer.id.in_(offer_ids)
+    of_applications = Application.offer_id.in_(offer_ids)
+    of_ratings = Rating.application_id.in_(db.select(Application.id).where(of_applications))
+    of_attachments = Attachment.offer_id.in_(offer_ids)
+
+    # Parents first when copying, children first when deleting (foreign keys)
+    _copy(Project, ArchivedProject, of_projects)
+    _copy(Offer, ArchivedOffer, of_offers)
+    _copy(Application, ArchivedApplication, of_applications)
+    _copy(Rating, ArchivedRating, of_ratings)
+    _copy(Attachment, ArchivedAttachment, of_attachments)
+
+    _delete(Rating, of_ratings)
+    _delete(Attachment, of_attachments)
+    _delete(Application, of_applications)
+    _delete(Offer, of_offers)
+    _delete(Project, of_projects)
+
+    # One transaction per batch - a failure leaves each batch either fully live or fully archived
+    db.session.commit()
+    return len(offer_ids)
+
+
+def _archive_batch_safely(project_ids, offer_ids, attempts=2):
+    """Archive one batch, trying again once if it fails. Returns offers moved, or None if it was skipped."""
+    for attempt in range(1, attempts + 1):
+        try:
+            return _archive_batch(project_ids, offer_ids)
+        except SQLAlchemyError:
+            db.session.rollback()
+            if attempt == attempts:
+                # Left in the live tables - the next run picks the batch up again
+                current_app.logger.exception('Archiving projects %s / offers %s failed', project_ids, offer_ids)
+                return None
+
+
+def archive_finished(older_than_days=30):
+    """Move projects finished more than `older_than_days` ago, and closed offers without a project
+    not changed for that long, to the archive tables. Returns (projects, offers) moved and
+    the number of batches that failed and were left for the next run.
+    """
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+
+    project_ids = list(db.session.scalars(
+        db.select(Project.id).where(Project.status == 'finished', Project.date_finished < cutoff).order_by(Project.id)
+    ))
+    standalone_offer_ids = list(db.session.scalars(
+        db.select(Offer.id).where(Offer.project_id.is_(None), Offer.status == 'closed', Offer.updated_at < cutoff)
+        .order_by(Offer.id)
+    ))
+
+    batches = [(project_ids[i:i + BATCH_SIZE], []) for i in range(0, len(project_ids), BATCH_SIZE)]
+    batches += [([], standalone_offer_ids[i:i + BATCH_SIZE]) for i in range(0, len(standalone_offer_ids), BATCH_SIZE)]
+
+    projects = offers = failed = 0
+    for batch_projects, batch_offers in batches:
+        moved = _archive_batch_safely(batch_projects, batch_offers)
+        if moved is None:
+            failed += 1
+        else:
+            projects += len(batch_projects)
+            offers += moved
+
+    return projects, offers, failed
+
+
+@click.command('archive-projects')
+@click.option('--older-than', default=30, show_default=True,
+              help='Archive projects finished at least this many days ago.')
+@with_appcontext
+def archive_projects(older_than):
+    """Move finished projects and closed offers out of the live tables. Meant to be run periodically."""
+    projects, offers, failed = archive_finished(older_than)
+    click.echo(f'Archived {projects} project(s) and {offers} offer(s).')
+    if failed:
+        click.echo(f'{failed} batch(es) failed and were skipped, see the log.', err=True)
@@ -0,0 +1,77 @@
+import threading
+import time
+from collections import namedtuple
+
+from . import db
+
+# Lightweight, immutable copy of a project row - safe to share between requests
+ProjectRow = namedtuple('ProjectRow', ['id', 'title', 'description', 'status',
+                                       'date_created', 'date_finished', 'worker_id'])
+
+# Reload after this many seconds - picks up changes made in other worker processes (e.g. archiving)
+MAX_AGE = 60
+
+
+class ProjectCache:
+    """Read-through cache of the project list, shared by all requests in a worker.
+
+    Every change to projects bumps the version; readers reload the list on the
+    next access. Call invalidate() after committing a change to a project.
+    The cache lives in the worker process, so other workers see the change
+    only after MAX_AGE seconds. Use it for display (lists, titles); checks
+    that guard writes have to read the project from the database.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = 0
+        # (version, all projects, active projects, projects by id, loaded at)
+        self._entry = None
+
+    def invalidate(self):
+        with self._lock:
+            self._version += 1
+            self._entry = None
+
+    def _load(self):
+        with self._lock:
+            entry = self._entry
+            version = self._version
+        if entry is not None and entry[0] == version and time.monotonic() - entry[4] <= MAX_AGE:
+            return entry
+
+        from .models import Project
+        rows = db.session.execute(
+            db.select(Project.id, Project.title, Project.description, Project.status,
+                      Project.date_created, Project.date_finished, Project.worker_id)
+            .order_by(Project.id),
+            # Always from the primary - a lagging replica would leave a stale list in the cache
+            bind_arguments={'bind': db.engine}
+        ).all()
+
+        all_rows = tuple(ProjectRow(*row) for row in rows)
+        active_rows = tuple(row for row in all_rows if row.status == 'active')
+        by_id = {row.id: row for row in all_rows}
+        entry = (version, all_rows, active_rows, by_id, time.monotonic())
+
+        with self._lock:
+            # Don't store the result if somebody invalidated the cache meanwhile
+            if self._version == version:
+                self._entry = entry
+        return entry
+
+    def all(self):
+        return self._load()[1]
+
+    def active(self):
+        return self._load()[2]
+
+    def get(self, project_id):
+        try:
+            project_id = int(project_id)
+        except (TypeError, ValueError):
+            return None
+        return self._load()[3].get(project_id)
+
+
+project_cache = ProjectCache()
@@ -0,0 +1,42 @@
+import random
+import time
+
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm.exc import StaleDataError
+
+from . import db
+
+# PostgreSQL: serialization_failure, deadlock_detected
+RETRYABLE_PGCODES = ('40001', '40P01')
+
+
+def is_conflict(error):
+    """True if the transaction failed only because of a concurrent change."""
+    if isinstance(error, StaleDataError):
+        # version_id_col check failed - somebody updated the row before us
+        return True
+    if isinstance(error, OperationalError):
+        if getattr(error.orig, 'pgcode', None) in RETRYABLE_PGCODES:
+            return True
+        # SQLite writer lock
+        return 'database is locked' in str(error.orig)
+    return False
+
+
+def run_in_transaction(work, attempts=3, backoff=0.05):
+    """Run work() and commit, retrying when it conflicts with another transaction.
+
+    work() is called again from scratch on every attempt, so it has to read
+    everything it needs itself (rows are expired by the rollback).
+    """
+    for attempt in range(1, attempts + 1):
+        try:
+            result = work()
+            db.session.commit()
+            return result
+        except (StaleDataError, OperationalError) as e:
+            db.session.rollback()
+            if attempt == attempts or not is_conflict(e):
+                raise
+            # Random backoff, so the competing requests don't collide again
+            time.sleep(backoff * attempt * (1 + random.random()))
@@ -0,0 +1,38 @@
+import hashlib
+
+from flask import make_response, request, session
+from flask_login import current_user
+
+
+def make_etag(*parts):
+    """Build an ETag from values that change whenever the page changes (ids, versions, timestamps)."""
+    # Pages of logged in users differ per user (navigation bar, permissions)
+    if current_user.is_authenticated:
+        parts = (current_user.id, current_user.user_type) + parts
+    return hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()
+
+
+def _private_cache_headers(response, etag):
+    response.set_etag(etag)
+    # Only the user's browser may store the page, and it has to ask us before using it
+    response.headers['Cache-Control'] = 'private, no-cache'
+    response.vary.add('Cookie')
+    return response
+
+
+def not_modified(etag):
+    """Return a 304 response if the browser already has this version of the page, else None.
+
+    Call it before rendering the template, so unchanged pages cost only the ETag queries.
+    """
+    # Pending flash messages are part of the page, so it has to be rendered again
+    if '_flashes' in session:
+        return None
+    if etag not in request.if_none_match:
+        return None
+    return _private_cache_headers(make_response('', 304), etag)
+
+
+def cacheable(body, etag):
+    """Wrap a rendered page with the ETag and cache headers."""
+    return _private_cache_headers(make_response(body), etag)
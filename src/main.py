@@ -1,6 +1,16 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request, abort
+from flask import Blueprint, render_template, redirect, url_for, flash, request, abort, current_app, send_file, Response
 from flask_login import login_required, current_user, UserMixin
-from .models import Administrator, Offer, Application, OrganizationWorker, Project, Rating, User, Inquiry
+from .models import Administrator, Offer, Application, OrganizationWorker, Project, Rating, User, Inquiry, Attachment
+from .models import ArchivedProject, ArchivedOffer, ArchivedRating, ArchivedAttachment
+from .storage import CHUNK_SIZE, IMAGE_TYPES
+from .cache import project_cache
+from .routing import read_only
+from .concurrency import run_in_transaction
+from .http_cache import make_etag, not_modified, cacheable
+from .matching import matcher
+from .analytics import mark_dirty, weekly_stats, project_stats
+from sqlalchemy.exc import IntegrityError
+from werkzeug.utils import secure_filename
 from . import db
 from datetime import datetime
 
@@ -21,20 +31,38 @@ def index():
 
 @main_bp.route('/dashboard')
 @login_required
+@read_only
 def dashboard():
     my_type = current_user.user_type
     all_offers = Offer.query.filter_by(status='approved').order_by(Offer.date_created.desc()).all()
-    projects = Project.query.all()
+
+    # Donors only need the project list itself - served from the cache.
+    # Workers and beneficiaries browse offers through project.offers, so they get ORM objects.
+    # Workers also see finished projects (to rate them) until they are archived.
+    if my_type == 'worker':
+        projects = Project.query.all()
+    elif my_type == 'beneficient':
+        projects = Project.query.filter_by(status='active').all()
+    else:
+        projects = project_cache.active()
 
     inquiries = []
     if current_user.user_type == 'worker':
         inquiries = Inquiry.query.order_by(Inquiry.created_at.desc()).all()
 
+    # Best matching offers for beneficiaries, picked from the offers already loaded above
+    recommended = []
+    if my_type == 'beneficient':
+        offers_by_id = {offer.id: offer for offer in all_offers}
+        recommended = [offers_by_id[offer_id] for offer_id in matcher.top_matches(current_user.id, n=6)
+                       if offer_id in offers_by_id]
+
     return render_template('dashboard.html',
                            user_type=my_type,
                            offers=all_offers,
                            projects=projects,
-                           inquiries=inquiries)
+                           inquiries=inquiries,
+                           recommended=recommended)
 
 
 @main_bp.route('/create-offer', methods=['GET', 'POST'])
@@ -45,9 +73,6 @@ def create_offer():
         flash('Permission denied. Only donors can create offers.', category='error')
         return redirect(url_for('main.dashboard'))
 
-    # Fetch active projects to display in the dropdown menu
-    projects = Project.query.all()
-
     if request.method == "POST":
         # Retrieve data from the HTML form
         title = request.form.get('title')
@@ -57,9 +82,10 @@ def create_offer():
         # Get selected src ID from the form
         project_id = request.form.get('project_id')
 
-        if project_id:
+        if project_id and project_id != '0':
+            # From the database, not project_cache - the check must see finishes and archiving done by other workers
             project = Project.query.get(project_id)
-            if project and project.status == 'finished':
+            if project is None or project.status == 'finished':
                 flash('You cannot add offers to a finished src.', category='error')
                 return redirect(url_for('main.dashboard'))
 
@@ -99,33 +125,35 @@ def edit_offer(offer_id):
         flash('Nie masz uprawnień do edycji tej oferty.', category='error')
         return redirect(url_for('main.dashboard'))
 
-    # 2. Pobierz listę projektów do dropdowna
-    projects = Project.query.all()
-
     if request.method == 'POST':
-        # 3. Pobranie danych z formularza
+        # 2. Pobranie danych z formularza
         title = request.form.get('title')
         description = request.form.get('description')
         offer_type = request.form.get('type')
         project_id = request.form.get('project_id')
 
-        # 4. Walidacja projektu (podobnie jak w create_offer)
+        # 3. Walidacja projektu (podobnie jak w create_offer)
         if project_id and project_id != '0':
             project = Project.query.get(project_id)
-            if project and project.status == 'finished':
+            if project is None or project.status == 'finished':
                 flash('Nie możesz przypisać oferty do zakończonego projektu.', category='error')
                 return redirect(url_for('main.edit_offer', offer_id=offer.id))
-            offer.project_id = project_id
         else:
-            offer.project_id = None
+            project_id = None
 
-        # 5. Aktualizacja pól
-        offer.title = title
-        offer.description = description
-        offer.offer_type = offer_type
+        def edit():
+            # Re-read on every attempt - an application or acceptance may have changed the offer (version_id)
+            offer = Offer.query.get_or_404(offer_id)
+            offer.project_id = project_id
 
+            # 4. Aktualizacja pól
+            offer.title = title
+            offer.description = description
+            offer.offer_type = offer_type
+            return offer
 
-        db.session.commit()
+        offer = run_in_transaction(edit)
+        matcher.sync_offer(offer)
         flash('Oferta została pomyślnie zaktualizowana!', category='success')
         return redirect(url_for('main.dashboard'))
 
@@ -134,6 +162,7 @@ def edit_offer(offer_id):
 
 @main_bp.route('/offer/<int:offer_id>')
 @login_required
+@read_only
 def offer_details(offer_id):
     # Try to get the offer, return 404 error if not found
     offer = Offer.query.get_or_404(offer_id)
@@ -144,7 +173,143 @@ def offer_details(offer_id):
     if offer.status != 'approved' and current_user.user_type not in ['administrator', 'worker'] and current_user.id != offer.donor_id:
         abort(403)  # 403 Forbidden
 
-    return render_template('offer_details.html', offer=offer)
+    # Conditional GET: if nothing on the page changed, answer 304 without rendering.
+    # The page also shows the offer's applications, attachments and project, so they are part of the ETag.
+    applications_state = db.session.execute(
+        db.select(db.func.count(Application.id), db.func.max(Application.updated_at))
+        .filter_by(offer_id=offer.id)
+    ).one()
+    attachments_count = db.session.scalar(
+        db.select(db.func.count(Attachment.id)).filter_by(offer_id=offer.id)
+    )
+    project_updated_at = offer.project.updated_at if offer.project else None
+    etag = make_etag('offer', offer.id, offer.version_id, offer.updated_at,
+                     tuple(applications_state), attachments_count, project_updated_at)
+
+    response = not_modified(etag)
+    if response:
+        return response
+
+    return cacheable(render_template('offer_details.html', offer=offer), etag)
+
+
+@main_bp.route('/offer/<int:offer_id>/attachments', methods=['POST'])
+@login_required
+def upload_attachment(offer_id):
+    offer = Offer.query.get_or_404(offer_id)
+
+    # Only the owner (donor) or administrator can add files to an offer
+    if current_user.id != offer.donor_id and current_user.user_type != 'administrator':
+        flash('You cannot add attachments to offers that are not yours!', category='error')
+        return redirect(url_for('main.dashboard'))
+
+    file = request.files.get('file')
+    if not file or not file.filename:
+        flash('No file selected.', category='error')
+        return redirect(url_for('main.dashboard'))
+
+    # The file is streamed into the blob store in chunks, never read whole
+    blob_store = current_app.extensions['blob_store']
+    blob_key, size = blob_store.save(file.stream)
+
+    attachment = Attachment(
+        filename=secure_filename(file.filename) or 'file',
+        url='',
+        blob_key=blob_key,
+        content_type=file.mimetype or 'application/octet-stream',
+        size=size,
+        offer_id=offer.id
+    )
+    db.session.add(attachment)
+    db.session.flush()
+    attachment.url = url_for('main.download_attachment', attachment_id=attachment.id)
+    db.session.commit()
+
+    # Thumbnails are generated in the background so the upload returns right away
+    current_app.extensions['thumbnail_worker'].submit(blob_key, attachment.content_type)
+
+    flash(f'File {attachment.filename} has been attached.', category='success')
+    return redirect(url_for('main.dashboard'))
+
+
+def _get_visible_attachment(attachment_id, model=Attachment):
+    attachment = model.query.get_or_404(attachment_id)
+    offer = attachment.offer
+
+    # Same rules as offer_details: hidden offers are visible only to staff and the owner
+    if offer.status != 'approved' and current_user.user_type not in ['administrator', 'worker'] and current_user.id != offer.donor_id:
+        abort(403)
+    if not attachment.blob_key:
+        abort(404)
+    return attachment
+
+
+def _stream_blob(fileobj):
+    with fileobj:
+        while True:
+            chunk = fileobj.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+
+
+def _send_attachment(attachment):
+    blob_store = current_app.extensions['blob_store']
+
+    # The content type comes from the uploader's browser, so only known image types are
+    # shown inline. Everything else (e.g. HTML with scripts) is always a plain download.
+    inline = attachment.content_type in IMAGE_TYPES and request.args.get('download') != '1'
+    mimetype = attachment.content_type if inline else 'application/octet-stream'
+
+    path = blob_store.path(attachment.blob_key)
+    if path:
+        # send_file streams from disk and handles Range / If-None-Match requests
+        response = send_file(path,
+                             mimetype=mimetype,
+                             as_attachment=not inline,
+                             download_name=attachment.filename,
+                             etag=attachment.blob_key,
+                             conditional=True,
+                             max_age=3600)
+    else:
+        # Remote store - stream the blob through
+        disposition = 'inline' if inline else 'attachment'
+        response = Response(_stream_blob(blob_store.open(attachment.blob_key)),
+                            mimetype=mimetype,
+                            headers={'Content-Length': str(attachment.size),
+                                     'Content-Disposition': f'{disposition}; filename="{attachment.filename}"'})
+
+    # Don't let the browser guess a different (executable) type from the content
+    response.headers['X-Content-Type-Options'] = 'nosniff'
+    return response
+
+
+@main_bp.route('/attachment/<int:attachment_id>')
+@login_required
+def download_attachment(attachment_id):
+    return _send_attachment(_get_visible_attachment(attachment_id))
+
+
+@main_bp.route('/history/attachment/<int:attachment_id>')
+@login_required
+def download_archived_attachment(attachment_id):
+    # Blobs stay in the store when their offer is archived
+    return _send_attachment(_get_visible_attachment(attachment_id, ArchivedAttachment))
+
+
+@main_bp.route('/attachment/<int:attachment_id>/thumbnail')
+@login_required
+def attachment_thumbnail(attachment_id):
+    attachment = _get_visible_attachment(attachment_id)
+    blob_store = current_app.extensions['blob_store']
+
+    path = blob_store.thumbnail_path(attachment.blob_key)
+    if not path:
+        # Not generated yet (or not an image)
+        abort(404)
+    response = send_file(path, mimetype='image/jpeg', etag=attachment.blob_key, conditional=True, max_age=3600)
+    response.headers['X-Content-Type-Options'] = 'nosniff'
+    return response
 
 
 @main_bp.route('/offer/<int:offer_id>/apply', methods=['POST'])
@@ -155,28 +320,52 @@ def apply_for_offer(offer_id):
         flash("Only beneficiaries can apply for help!", category='error')
         return redirect(url_for('main.dashboard'))
 
-    offer = Offer.query.get_or_404(offer_id)
-
-    # 2. Duplication check: Prevent sending multiple applications for the same offer
-    existing_application = Application.query.filter_by(offer_id=offer_id, applicant_id=current_user.id).first()
-    if existing_application:
-        flash("You have already applied for this offer! Please wait for a response.")
-        return redirect(url_for('main.dashboard'))
-
-    # 3. Retrieve the message from the form
+    # 2. Retrieve the message from the form
     msg = request.form.get('message')
 
-    # 4. Create the Application object (Link between User and Offer)
-    new_application = Application(
-        message=msg,
-        offer_id=offer.id,
-        applicant_id=current_user.id
-        # dodac status oferty
-    )
+    def apply():
+        offer = Offer.query.get_or_404(offer_id)
+
+        # 3. Duplication check: Prevent sending multiple applications for the same offer.
+        # Done first, so a duplicate doesn't touch the offer's version below.
+        existing_application = Application.query.filter_by(offer_id=offer_id, applicant_id=current_user.id).first()
+        if existing_application:
+            return 'duplicate'
+
+        # Conditional UPDATE: it matches only while the offer is still approved and holds the row
+        # lock (PostgreSQL) / write lock (SQLite) until commit. Bumping version_id makes an
+        # accept_application that read the applications before ours was inserted fail its version
+        # check and retry, so no application is left pending on a closed offer. Every other ORM
+        # writer of Offer runs in run_in_transaction, so it retries instead of failing.
+        locked = db.session.execute(
+            db.update(Offer).where(Offer.id == offer_id, Offer.status == 'approved')
+            .values(version_id=Offer.version_id + 1, updated_at=Offer.updated_at)
+        ).rowcount
+        if not locked:
+            return 'closed'
+
+        # 4. Create the Application object (Link between User and Offer)
+        db.session.add(Application(
+            message=msg,
+            offer_id=offer.id,
+            applicant_id=current_user.id
+        ))
+        return 'sent'
 
     # 5. Commit changes to the database
-    db.session.add(new_application)
-    db.session.commit()
+    try:
+        result = run_in_transaction(apply)
+    except IntegrityError:
+        # A parallel request inserted the same application first (unique constraint)
+        db.session.rollback()
+        result = 'duplicate'
+
+    if result == 'duplicate':
+        flash("You have already applied for this offer! Please wait for a response.")
+        return redirect(url_for('main.dashboard'))
+    if result == 'closed':
+        flash("This offer is no longer available.", category='error')
+        return redirect(url_for('main.dashboard'))
 
     flash('Your application has been sent to the Donor!', category='success')
 
@@ -205,23 +394,44 @@ def manage_offer(offer_id):
 @main_bp.route('/application/<int:app_id>/accept', methods=['POST'])
 @login_required
 def accept_application(app_id):
-    application = Application.query.get_or_404(app_id)
+    def accept():
+        application = Application.query.get_or_404(app_id)
 
-    # Security check: Verify if the current user is the owner of the offer associated with this application
-    if application.offer.donor_id != current_user.id:
-        flash('You cannot manage applications for offers that are not yours!', category='error')
-        return redirect(url_for('main.dashboard'))
+        # Lock the offer first and then its applications (always in this order, so two
+        # requests can't deadlock). Without row locks (SQLite) the version columns catch the race.
+        offer = Offer.query.filter_by(id=application.offer_id).with_for_update().populate_existing().one()
+        applications = Application.query.filter_by(offer_id=offer.id).order_by(Application.id) \
+            .with_for_update().populate_existing().all()
 
-    # Update statuses
-    application.status = 'accepted'
-    application.offer.status = 'closed'  # Close the offer so it disappears from the
+        # Security check: Verify if the current user is the owner of the offer associated with this application
+        if offer.donor_id != current_user.id:
+            return 'forbidden', application
 
-    for other_application in application.offer.applications:
-        if other_application.id != application.id and other_application.status == 'pending':
-            other_application.status = 'rejected'
+        # Somebody (e.g. a second click) has already decided about this offer
+        if offer.status == 'closed' or application.status != 'pending':
+            return 'already_closed', application
 
-    # Save changes to the database
-    db.session.commit()
+        # Update statuses
+        application.status = 'accepted'
+        offer.status = 'closed'  # Close the offer so it disappears from the
+
+        for other_application in applications:
+            if other_application.id != application.id and other_application.status == 'pending':
+                other_application.status = 'rejected'
+
+        return 'accepted', application
+
+    # Save changes to the database, retried if another request changed the offer meanwhile
+    result, application = run_in_transaction(accept)
+    if result == 'accepted':
+        matcher.remove_offer(application.offer_id)
+
+    if result == 'forbidden':
+        flash('You cannot manage applications for offers that are not yours!', category='error')
+        return redirect(url_for('main.dashboard'))
+    if result == 'already_closed':
+        flash('This offer has already been closed.', category='info')
+        return redirect(url_for('main.dashboard'))
 
     flash(f'You have accepted help for user {application.applicant.first_name}!', category='success')
 
@@ -233,6 +443,7 @@ def accept_application(app_id):
 # --- WORKER PANEL (MODERATION) ---
 @main_bp.route('/worker/pending_users')
 @login_required
+@read_only
 def pending_users():
     if current_user.user_type != 'worker':
         abort(403)
@@ -274,12 +485,17 @@ def approve_offer(offer_id):
     if current_user.user_type != 'worker':
         abort(403)  # Return "Forbidden" error if the user is unauthorized
 
-    offer = Offer.query.get_or_404(offer_id)
+    def approve():
+        offer = Offer.query.get_or_404(offer_id)
 
-    # 2. Change status to 'approved'
-    # This makes the offer visible on the main Dashboard for all users
-    offer.status = 'approved'
-    db.session.commit()
+        # 2. Change status to 'approved'
+        # This makes the offer visible on the main Dashboard for all users
+        offer.status = 'approved'
+        offer.date_approved = datetime.utcnow()
+        return offer
+
+    offer = run_in_transaction(approve)
+    matcher.sync_offer(offer)
 
     flash(f'Offer "{offer.title}" has been approved.', category='success')
 
@@ -297,10 +513,16 @@ def delete_offer(offer_id):
         flash('Nie masz uprawnień do usunięcia tej oferty.', category='error')
         return redirect(url_for('main.dashboard'))
 
-    try:
+    def delete():
+        # Re-read on every attempt - an application may have been added meanwhile
+        offer = Offer.query.get_or_404(offer_id)
+
         # 2. Ręczne usuwanie powiązanych rekordów (jeśli nie masz ustawionego cascade w modelach)
         # Usuwamy wszystkie aplikacje przypisane do tej oferty
+        # Deleted rows disappear from the analytics only if their days are recomputed
+        mark_dirty(offer.date_created, offer.date_approved)
         for application in offer.applications:
+            mark_dirty(application.date_created, *[rating.date_created for rating in application.ratings])
             db.session.delete(application)
 
         # Usuwamy załączniki przypisane do oferty
@@ -309,7 +531,10 @@ def delete_offer(offer_id):
 
         # 3. Usunięcie samej oferty
         db.session.delete(offer)
-        db.session.commit()
+
+    try:
+        run_in_transaction(delete)
+        matcher.remove_offer(offer_id)
 
         flash('Oferta oraz wszystkie powiązane z nią zgłoszenia zostały usunięte.', category='success')
     except Exception as e:
@@ -331,6 +556,7 @@ def edit_project(project_id):
         project.description = request.form.get('description')
 
         db.session.commit()
+        project_cache.invalidate()
         flash(f'Project: {project.title} has been updated.', category='success')
         return redirect(url_for('main.dashboard'))
     # if GET
@@ -343,15 +569,25 @@ def finish_project(project_id):
     if current_user.user_type != 'worker':
         abort(403)
 
-    project = Project.query.get_or_404(project_id)
+    def finish():
+        project = Project.query.get_or_404(project_id)
+
+        # Prevent double finish
+        if project.status == 'finished':
+            return None
 
-    # Prevent double finish
-    if project.status == 'finished':
+        # Closes the project's offers - retried if an application changed one of them meanwhile
+        project.finish()
+        return project
+
+    project = run_in_transaction(finish)
+    if project is None:
         flash('Project is already finished.', category='info')
         return redirect(url_for('main.dashboard'))
 
-    project.finish()
-    db.session.commit()
+    project_cache.invalidate()
+    for offer in project.offers:
+        matcher.remove_offer(offer.id)
 
     flash(f'Project "{project.title}" has been finished. All related offers were closed.',
           category='success')
@@ -367,11 +603,15 @@ def reject_offer(offer_id):
     if current_user.user_type != 'worker':
         abort(403)
 
-    offer = Offer.query.get_or_404(offer_id)
+    def reject():
+        offer = Offer.query.get_or_404(offer_id)
 
-    # Delete the offer from the database permanently, this or changing the status
-    db.session.delete(offer)
-    db.session.commit()
+        # Delete the offer from the database permanently, this or changing the status
+        mark_dirty(offer.date_created)
+        db.session.delete(offer)
+
+    run_in_transaction(reject)
+    matcher.remove_offer(offer_id)
 
     flash('Offer has been rejected and deleted.', category='info')
     return redirect(url_for('main.pending_offers'))
@@ -379,7 +619,33 @@ def reject_offer(offer_id):
 
 @main_bp.route('/profile')
 @login_required
+@read_only
 def profile():
+    # Conditional GET: the ETag is built from a cheap aggregate over the listed rows -
+    # any insert, update (updated_at) or delete changes the count or the newest timestamp.
+    # Offers and their applications are shown together, so both sides are included.
+    if current_user.user_type == 'donor':
+        state = db.session.execute(
+            db.select(db.func.count(db.distinct(Offer.id)), db.func.max(Offer.updated_at),
+                      db.func.count(Application.id), db.func.max(Application.updated_at))
+            .select_from(Offer).outerjoin(Application, Application.offer_id == Offer.id)
+            .where(Offer.donor_id == current_user.id)
+        ).one()
+    elif current_user.user_type == 'beneficient':
+        state = db.session.execute(
+            db.select(db.func.count(Application.id), db.func.max(Application.updated_at),
+                      db.func.max(Offer.updated_at))
+            .select_from(Application).join(Offer, Application.offer_id == Offer.id)
+            .where(Application.applicant_id == current_user.id)
+        ).one()
+    else:
+        state = ()
+    etag = make_etag('profile', current_user.email, current_user.is_approved, tuple(state))
+
+    response = not_modified(etag)
+    if response:
+        return response
+
     # Initialize empty lists to avoid errors if user type is unknown
     my_offers = []
     my_applications = []
@@ -394,7 +660,7 @@ def profile():
             Application.date_created.desc()).all()
 
     # Pass both lists to the template. The frontend will decide which one to display based on user_type.
-    return render_template('profile.html', my_offers=my_offers, my_applications=my_applications)
+    return cacheable(render_template('profile.html', my_offers=my_offers, my_applications=my_applications), etag)
 
 
 # --- ADMIN PANEL ---
@@ -430,6 +696,39 @@ def create_worker():
     return render_template('create_worker.html')
 
 
+@main_bp.route('/admin/analytics')
+@login_required
+@read_only
+def admin_analytics():
+    if current_user.user_type != 'administrator':
+        abort(403)
+
+    weeks = request.args.get('weeks', 12, type=int)
+    weeks = max(1, min(weeks, 104))
+
+    # Everything comes from the daily rollups, never from the live tables
+    weekly = weekly_stats(weeks)
+    per_project = project_stats()
+    # Titles of projects that were already moved to the archive
+    archived_titles = dict(db.session.execute(
+        db.select(ArchivedProject.id, ArchivedProject.title)
+        .where(ArchivedProject.id.in_([row['project_id'] for row in per_project if row['project_id']]))
+    ).all())
+    for row in per_project:
+        project = project_cache.get(row['project_id'])
+        if project:
+            row['title'] = project.title
+        elif row['project_id']:
+            row['title'] = archived_titles.get(row['project_id'], f"#{row['project_id']}")
+        else:
+            row['title'] = 'Bez projektu'
+        row['acceptance_rate'] = (row['applications_accepted'] / row['applications_created']
+                                  if row['applications_created'] else None)
+        row['average_rating'] = row['ratings_sum'] / row['ratings_count'] if row['ratings_count'] else None
+
+    return render_template('admin_analytics.html', weekly=weekly, per_project=per_project, weeks=weeks)
+
+
 # --- PROJECT MANAGEMENT ---
 # Add view projectds
 @main_bp.route('/worker/create-src', methods=['GET', 'POST'])
@@ -450,6 +749,7 @@ def create_project():
         )
         db.session.add(new_project)
         db.session.commit()
+        project_cache.invalidate()
         flash('Charity src created successfully.', category='success')
         return redirect(url_for('main.dashboard'))
 
@@ -484,6 +784,8 @@ def rate_interaction(app_id):
 
     db.session.add(new_rating)
     db.session.commit()
+    if rating_type == 'donor_rating':
+        matcher.refresh_donor(application.offer.donor_id)
 
     flash('Thank you for your feedback!', category='success')
     return redirect(url_for('main.dashboard'))
@@ -514,15 +816,22 @@ def send_inquiry():
     return redirect(url_for('main.guest_dashboard'))
 
 @main_bp.route('/guest')
+@read_only
 def guest_dashboard():
     offers = Offer.query.filter_by(status='approved') \
         .order_by(Offer.date_created.desc()).all()
 
+    # Finished projects: the ones still in the live tables plus the most recent archived ones
     projects = Project.query.filter(Project.status != 'active') \
         .order_by(Project.date_created.desc()).all()
+    projects += ArchivedProject.query.order_by(ArchivedProject.date_finished.desc()).limit(10).all()
 
+    # Newest ratings from both live and archived data (archived rows keep their ids)
     ratings = Rating.query.filter_by(rating_type='donor_rating') \
         .order_by(Rating.id.desc()).limit(10).all()
+    ratings += ArchivedRating.query.filter_by(rating_type='donor_rating') \
+        .order_by(ArchivedRating.id.desc()).limit(10).all()
+    ratings = sorted(ratings, key=lambda rating: rating.id, reverse=True)[:10]
 
     return render_template(
         'guest_dashboard.html',
@@ -530,3 +839,24 @@ def guest_dashboard():
         projects=projects,
         ratings=ratings
     )
+
+
+@main_bp.route('/history')
+@read_only
+def history():
+    # Archived (finished) projects with their offers - the live tables hold only current data
+    page = request.args.get('page', 1, type=int)
+    projects = db.paginate(
+        db.select(ArchivedProject).order_by(ArchivedProject.date_finished.desc())
+        .options(db.selectinload(ArchivedProject.offers).selectinload(ArchivedOffer.applications),
+                 db.selectinload(ArchivedProject.offers).selectinload(ArchivedOffer.attachments)),
+        page=page, per_page=20, error_out=False
+    )
+    # Closed offers without a project are archived on their own - listed separately, paged separately
+    offers_page = request.args.get('offers_page', 1, type=int)
+    offers = db.paginate(
+        db.select(ArchivedOffer).where(ArchivedOffer.project_id.is_(None)).order_by(ArchivedOffer.updated_at.desc())
+        .options(db.selectinload(ArchivedOffer.applications), db.selectinload(ArchivedOffer.attachments)),
+        page=offers_page, per_page=20, error_out=False
+    )
+    return render_template('history.html', projects=projects, offers=offers)
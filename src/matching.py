@@ -0,0 +1,288 @@
+import threading
+import time
+import zlib
+from datetime import timezone
+
+import numpy as np
+from flask import current_app
+
+from . import db
+
+# Offer features (offer type, project) are hashed into a fixed number of columns,
+# so new types and projects never change the shape of the matrix
+FEATURE_DIMS = 64
+
+# How much the parts of the score matter
+DONOR_RATING_WEIGHT = 0.3
+RECENCY_WEIGHT = 0.1
+RECENCY_DAYS = 30.0
+
+# How a past application says "I'm interested in offers like this one"
+APPLICATION_WEIGHTS = {'accepted': 2.0, 'pending': 1.0, 'rejected': 0.5}
+
+# Full reload after this many seconds - picks up changes made in other worker processes
+MAX_AGE = 300
+
+
+def _feature(kind, value):
+    return zlib.crc32(f'{kind}:{value}'.encode('utf-8')) % FEATURE_DIMS
+
+
+def _offer_features(offer_type, project_id):
+    vector = np.zeros(FEATURE_DIMS, dtype=np.float32)
+    vector[_feature('type', offer_type)] += 1.0
+    if project_id is not None:
+        vector[_feature('project', project_id)] += 1.0
+    # Normalized, so the dot product with a user profile is a cosine-like similarity
+    return vector / np.linalg.norm(vector)
+
+
+def _donor_quality(average_score):
+    # donor_rating 1..5 -> -1..1, donors without ratings are neutral
+    if average_score is None:
+        return 0.0
+    return (float(average_score) - 3.0) / 2.0
+
+
+class _OfferIndex:
+    """Feature rows of the approved offers, in NumPy arrays."""
+
+    def __init__(self, capacity=0):
+        capacity = max(capacity, 1024)
+        self.features = np.zeros((capacity, FEATURE_DIMS), dtype=np.float32)
+        self.quality = np.zeros(capacity, dtype=np.float32)
+        self.created = np.zeros(capacity, dtype=np.float64)
+        self.offer_ids = np.zeros(capacity, dtype=np.int64)
+        self.donor_ids = np.zeros(capacity, dtype=np.int64)
+        self.rows = {}  # offer id -> row
+        self.count = 0
+
+    def _grow(self):
+        capacity = len(self.offer_ids) * 2
+        self.features = np.resize(self.features, (capacity, FEATURE_DIMS))
+        self.quality = np.resize(self.quality, capacity)
+        self.created = np.resize(self.created, capacity)
+        self.offer_ids = np.resize(self.offer_ids, capacity)
+        self.donor_ids = np.resize(self.donor_ids, capacity)
+
+    def put(self, offer_id, offer_type, project_id, donor_id, date_created, quality):
+        row = self.rows.get(offer_id)
+        if row is None:
+            if self.count == len(self.offer_ids):
+                self._grow()
+            row = self.count
+            self.count += 1
+            self.rows[offer_id] = row
+
+        self.features[row] = _offer_features(offer_type, project_id)
+        self.quality[row] = quality
+        self.created[row] = date_created.replace(tzinfo=timezone.utc).timestamp() if date_created else 0.0
+        self.offer_ids[row] = offer_id
+        self.donor_ids[row] = donor_id
+
+    def remove(self, offer_id):
+        row = self.rows.pop(offer_id, None)
+        if row is None:
+            return
+        # Move the last row into the hole, so the used rows stay contiguous
+        last = self.count - 1
+        if row != last:
+            for array in (self.features, self.quality, self.created, self.offer_ids, self.donor_ids):
+                array[row] = array[last]
+            self.rows[int(self.offer_ids[row])] = row
+        self.count -= 1
+
+    def set_quality(self, donor_id, quality):
+        count = self.count
+        self.quality[:count][self.donor_ids[:count] == donor_id] = quality
+
+
+class OfferMatcher:
+    """Ranks approved offers for a beneficiary.
+
+    Keeps one feature row per approved offer in NumPy arrays, so scoring every
+    offer is a single matrix-vector product. The arrays are updated offer by
+    offer (sync_offer / remove_offer) when offers are approved, edited or
+    closed, and rebuilt from the database at most every MAX_AGE seconds.
+
+    A rebuild reads the database and fills new arrays without holding the lock,
+    then swaps them in. Only the very first load makes a request wait; later
+    ones run in a background thread while requests keep using the old arrays.
+    """
+
+    def __init__(self):
+        # Guards self._index and self._pending - held only for in-memory work
+        self._lock = threading.Lock()
+        # Held while a rebuild runs, so there is never more than one
+        self._reload_lock = threading.Lock()
+        self._loaded_at = None
+        self._index = _OfferIndex()
+        # Changes made while a rebuild is running, replayed on the new arrays (None = no rebuild)
+        self._pending = None
+
+    def _donor_scores(self, donor_ids=None):
+        from .models import Offer, Application, Rating
+
+        query = db.select(Offer.donor_id, db.func.avg(Rating.score)) \
+            .join(Application, Application.offer_id == Offer.id) \
+            .join(Rating, Rating.application_id == Application.id) \
+            .where(Rating.rating_type == 'donor_rating') \
+            .group_by(Offer.donor_id)
+        if donor_ids is not None:
+            query = query.where(Offer.donor_id.in_(donor_ids))
+        # Kept for minutes, so always read from the primary, never from a lagging replica
+        result = db.session.execute(query, bind_arguments={'bind': db.engine})
+        return {donor_id: _donor_quality(score) for donor_id, score in result}
+
+    def _build(self):
+        from .models import Offer
+
+        rows = db.session.execute(
+            db.select(Offer.id, Offer.offer_type, Offer.project_id, Offer.donor_id, Offer.date_created)
+            .where(Offer.status == 'approved'),
+            bind_arguments={'bind': db.engine}
+        ).all()
+        donor_scores = self._donor_scores()
+
+        index = _OfferIndex(len(rows) * 2)
+        for offer_id, offer_type, project_id, donor_id, date_created in rows:
+            index.put(offer_id, offer_type, project_id, donor_id, date_created,
+                      donor_scores.get(donor_id, 0.0))
+        return index
+
+    def _load(self):
+        # Caller holds self._reload_lock
+        with self._lock:
+            self._pending = []
+        try:
+            index = self._build()
+        except Exception:
+            with self._lock:
+                self._pending = None
+            raise
+
+        with self._lock:
+            for name, args in self._pending:
+                getattr(index, name)(*args)
+            self._index = index
+            self._pending = None
+            self._loaded_at = time.monotonic()
+
+    def _load_in_background(self, app):
+        try:
+            with app.app_context():
+                self._load()
+        except Exception:
+            # The old arrays stay in use, the next request tries again
+            app.logger.exception('Offer matcher reload failed')
+        finally:
+            self._reload_lock.release()
+
+    def ensure_loaded(self):
+        if self._loaded_at is None:
+            # Nothing to serve yet - this request has to wait for the first load
+            with self._reload_lock:
+                if self._loaded_at is None:
+                    self._load()
+        elif time.monotonic() - self._loaded_at > MAX_AGE:
+            if self._reload_lock.acquire(blocking=False):
+                app = current_app._get_current_object()
+                threading.Thread(target=self._load_in_background, args=(app,), daemon=True).start()
+
+    def _apply(self, name, *args):
+        # Caller holds self._lock
+        getattr(self._index, name)(*args)
+        if self._pending is not None:
+            # A rebuild may have read the database before this change - repeat it on the new arrays
+            self._pending.append((name, args))
+
+    def _tracking(self):
+        return self._loaded_at is not None or self._pending is not None
+
+    def sync_offer(self, offer):
+        """Call after an offer was approved, edited or closed (after commit)."""
+        if not self._tracking():
+            # Nothing loaded yet - the first ensure_loaded() reads the current state
+            return
+        if offer.status == 'approved':
+            # Query outside the lock, so other requests can keep scoring meanwhile
+            quality = self._donor_scores([offer.donor_id]).get(offer.donor_id, 0.0)
+            with self._lock:
+                self._apply('put', offer.id, offer.offer_type, offer.project_id, offer.donor_id,
+                            offer.date_created, quality)
+        else:
+            with self._lock:
+                self._apply('remove', offer.id)
+
+    def remove_offer(self, offer_id):
+        with self._lock:
+            self._apply('remove', offer_id)
+
+    def refresh_donor(self, donor_id):
+        """Call after a donor got a new rating."""
+        if not self._tracking():
+            return
+        quality = self._donor_scores([donor_id]).get(donor_id, 0.0)
+        with self._lock:
+            self._apply('set_quality', donor_id, quality)
+
+    def _user_profile(self, user_id):
+        """Feature vector of what the user applied for, weighted by outcome and their own ratings."""
+        from .models import Offer, Application, Rating
+
+        history = db.session.execute(
+            db.select(Application.offer_id, Application.status, Offer.offer_type, Offer.project_id,
+                      db.func.avg(Rating.score))
+            .join(Offer, Application.offer_id == Offer.id)
+            .outerjoin(Rating, db.and_(Rating.application_id == Application.id,
+                                       Rating.rating_type == 'help_survey',
+                                       Rating.rater_id == user_id))
+            .where(Application.applicant_id == user_id)
+            .group_by(Application.id, Application.offer_id, Application.status, Offer.offer_type, Offer.project_id)
+        ).all()
+
+        profile = np.zeros(FEATURE_DIMS, dtype=np.float32)
+        applied = []
+        for offer_id, status, offer_type, project_id, survey_score in history:
+            applied.append(offer_id)
+            weight = APPLICATION_WEIGHTS.get(status, 1.0)
+            if survey_score is not None:
+                # Good help (5) doubles the interest, bad help (1) cancels it
+                weight *= (float(survey_score) - 1.0) / 2.0
+            profile += weight * _offer_features(offer_type, project_id)
+
+        norm = np.linalg.norm(profile)
+        if norm > 0:
+            profile /= norm
+        return profile, applied
+
+    def top_matches(self, user_id, n=10):
+        """Ids of the n best approved offers for the user, best first."""
+        self.ensure_loaded()
+        profile, applied = self._user_profile(user_id)
+
+        with self._lock:
+            index = self._index
+            count = index.count
+            if count == 0:
+                return []
+
+            now = time.time()
+            age_days = (now - index.created[:count]) / 86400.0
+            scores = index.features[:count] @ profile \
+                + DONOR_RATING_WEIGHT * index.quality[:count] \
+                + RECENCY_WEIGHT * np.exp(-age_days / RECENCY_DAYS)
+
+            # Don't recommend offers the user has already applied for
+            applied_rows = [index.rows[offer_id] for offer_id in applied if offer_id in index.rows]
+            scores[applied_rows] = -np.inf
+
+            n = min(n, count)
+            # Partial sort - only the best n are ordered
+            best = np.argpartition(-scores, n - 1)[:n]
+            best = best[np.argsort(-scores[best])]
+            best = best[np.isfinite(scores[best])]
+            return [int(offer_id) for offer_id in index.offer_ids[best]]
+
+
+matcher = OfferMatcher()
@@ -46,20 +46,23 @@ class Project(db.Model):
     description = db.Column(db.Text, nullable=False)
     date_created = db.Column(db.DateTime, default=datetime.utcnow)
 
-    status = db.Column(db.String(20), default='active')  # active / finished
+    status = db.Column(db.String(20), default='active', index=True)  # active / finished
     date_finished = db.Column(db.DateTime, nullable=True)
+    # Changed on every UPDATE - used for ETags
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     worker_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     worker = db.relationship('User', backref='managed_projects')
 
     def finish(self):
-        self.status = 'finished'
-        self.date_finished = datetime.utcnow()
-
-        # Close all related offers
+        # Close all related offers - before changing the project, so loading them doesn't autoflush
+        # and all UPDATEs go out together at commit
         for offer in self.offers:
             offer.status = 'closed'
 
+        self.status = 'finished'
+        self.date_finished = datetime.utcnow()
+
 
 class Rating(db.Model):
     __tablename__ = 'ratings'
@@ -67,6 +70,7 @@ class Rating(db.Model):
     score = db.Column(db.Integer, nullable=False)  # 1-5
     comment = db.Column(db.Text, nullable=True)
     rating_type = db.Column(db.String(20))  # 'donor_rating' lub 'help_survey'
+    date_created = db.Column(db.DateTime, default=datetime.utcnow, index=True)
 
     rater_id = db.Column(db.Integer, db.ForeignKey('users.id'))
 
@@ -80,8 +84,11 @@ class Offer(db.Model):
     title = db.Column(db.String(100), nullable=False)
     description = db.Column(db.Text, nullable=False)
     offer_type = db.Column(db.String(30), nullable=False)
-    status = db.Column(db.String, default='pending')
-    date_created = db.Column(db.DateTime, default=datetime.utcnow)
+    status = db.Column(db.String, default='pending', index=True)
+    # Indexed - the analytics rollups look rows up by these dates
+    date_created = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    date_approved = db.Column(db.DateTime, nullable=True, index=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
     # Foreign key
     donor_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     # Making a relationship between donor and an offer, so we can easily get informations,
@@ -92,12 +99,17 @@ class Offer(db.Model):
     project_id = db.Column(db.Integer, db.ForeignKey('projects.id'), nullable=True)
     project = db.relationship('Project', backref='offers')
 
+    # Optimistic locking - an UPDATE of a row changed by someone else raises StaleDataError
+    version_id = db.Column(db.Integer, nullable=False, default=1)
+    __mapper_args__ = {'version_id_col': version_id}
+
 class Application(db.Model):
     __tablename__ = 'applications'
     id = db.Column(db.Integer, primary_key=True)
     message = db.Column(db.Text, nullable=True)
     status = db.Column(db.String(50), default='pending')
-    date_created = db.Column(db.DateTime, default=datetime.utcnow)
+    date_created = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
 
     # Who is sending an application
     applicant_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -109,12 +121,21 @@ class Application(db.Model):
     # So we can show all user's applications
     applicant = db.relationship('User', backref='my_applications')
 
+    version_id = db.Column(db.Integer, nullable=False, default=1)
+    __mapper_args__ = {'version_id_col': version_id}
+    # One application per user and offer, also when two requests race
+    __table_args__ = (db.UniqueConstraint('offer_id', 'applicant_id', name='uq_application_offer_applicant'),)
+
 
 class Attachment(db.Model):
     __tablename__ = 'attachments'
     id = db.Column(db.Integer, primary_key=True)
     filename = db.Column(db.String(255), nullable=False)
     url = db.Column(db.String(500), nullable=False)
+    # SHA-256 of the content - key in the blob store
+    blob_key = db.Column(db.String(64), nullable=True)
+    content_type = db.Column(db.String(100), nullable=True)
+    size = db.Column(db.Integer, nullable=True)
     date_uploaded = db.Column(db.DateTime, default=datetime.utcnow)
 
     # Powiązanie z ofertą (zgodnie z IO)
@@ -132,3 +153,113 @@ class Inquiry(db.Model):
     # Kto pyta? (User)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     user = db.relationship('User', backref='inquiries')
+
+
+# --- ARCHIVE (filled by `flask archive-projects`, see archive.py) ---
+# Finished projects with their closed offers, applications, ratings and attachments are moved
+# here from the live tables. Rows keep their original ids.
+class ArchivedProject(db.Model):
+    __tablename__ = 'archived_projects'
+    id = db.Column(db.Integer, primary_key=True)
+    title = db.Column(db.String(100), nullable=False)
+    description = db.Column(db.Text, nullable=False)
+    date_created = db.Column(db.DateTime)
+    status = db.Column(db.String(20))
+    date_finished = db.Column(db.DateTime, index=True)
+    updated_at = db.Column(db.DateTime)
+    worker_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    date_archived = db.Column(db.DateTime, default=datetime.utcnow)
+
+    worker = db.relationship('User')
+
+
+class ArchivedOffer(db.Model):
+    __tablename__ = 'archived_offers'
+    id = db.Column(db.Integer, primary_key=True)
+    title = db.Column(db.String(100), nullable=False)
+    description = db.Column(db.Text, nullable=False)
+    offer_type = db.Column(db.String(30), nullable=False)
+    status = db.Column(db.String)
+    date_created = db.Column(db.DateTime, index=True)
+    date_approved = db.Column(db.DateTime, index=True)
+    updated_at = db.Column(db.DateTime, index=True)
+    donor_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    project_id = db.Column(db.Integer, db.ForeignKey('archived_projects.id'), nullable=True, index=True)
+    version_id = db.Column(db.Integer)
+
+    donor = db.relationship('User')
+    project = db.relationship('ArchivedProject', backref='offers')
+
+
+class ArchivedApplication(db.Model):
+    __tablename__ = 'archived_applications'
+    id = db.Column(db.Integer, primary_key=True)
+    message = db.Column(db.Text, nullable=True)
+    status = db.Column(db.String(50))
+    date_created = db.Column(db.DateTime, index=True)
+    updated_at = db.Column(db.DateTime, index=True)
+    applicant_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    offer_id = db.Column(db.Integer, db.ForeignKey('archived_offers.id'), nullable=False, index=True)
+    version_id = db.Column(db.Integer)
+
+    offer = db.relationship('ArchivedOffer', backref='applications')
+    applicant = db.relationship('User')
+
+
+class ArchivedRating(db.Model):
+    __tablename__ = 'archived_ratings'
+    id = db.Column(db.Integer, primary_key=True)
+    score = db.Column(db.Integer, nullable=False)
+    comment = db.Column(db.Text, nullable=True)
+    rating_type = db.Column(db.String(20))
+    date_created = db.Column(db.DateTime, index=True)
+    rater_id = db.Column(db.Integer, db.ForeignKey('users.id'))
+    application_id = db.Column(db.Integer, db.ForeignKey('archived_applications.id'), index=True)
+
+    application = db.relationship('ArchivedApplication', backref='ratings')
+
+
+class ArchivedAttachment(db.Model):
+    __tablename__ = 'archived_attachments'
+    id = db.Column(db.Integer, primary_key=True)
+    filename = db.Column(db.String(255), nullable=False)
+    url = db.Column(db.String(500), nullable=False)
+    blob_key = db.Column(db.String(64), nullable=True)
+    content_type = db.Column(db.String(100), nullable=True)
+    size = db.Column(db.Integer, nullable=True)
+    date_uploaded = db.Column(db.DateTime)
+    offer_id = db.Column(db.Integer, db.ForeignKey('archived_offers.id'), nullable=False, index=True)
+
+    offer = db.relationship('ArchivedOffer', backref='attachments')
+
+
+# --- ANALYTICS ROLLUPS (maintained by `flask rollup-analytics`, see analytics.py) ---
+class DailyStat(db.Model):
+    __tablename__ = 'daily_stats'
+    id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, nullable=False, index=True)
+    # No foreign key - stats stay when projects are removed or archived. None = offers without project
+    project_id = db.Column(db.Integer, nullable=True)
+
+    offers_created = db.Column(db.Integer, nullable=False, default=0)
+    offers_approved = db.Column(db.Integer, nullable=False, default=0)
+    # Applications by the day they were sent, and how many of them were accepted
+    applications_created = db.Column(db.Integer, nullable=False, default=0)
+    applications_accepted = db.Column(db.Integer, nullable=False, default=0)
+    ratings_count = db.Column(db.Integer, nullable=False, default=0)
+    ratings_sum = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (db.UniqueConstraint('day', 'project_id', name='uq_daily_stats_day_project'),)
+
+
+class RollupState(db.Model):
+    __tablename__ = 'rollup_state'
+    name = db.Column(db.String(50), primary_key=True)
+    # Rows changed after this moment haven't been rolled up yet
+    watermark = db.Column(db.DateTime, nullable=True)
+
+
+class RollupDirtyDay(db.Model):
+    # Days to recompute because rows were deleted (deleted rows can't be found by updated_at)
+    __tablename__ = 'rollup_dirty_days'
+    day = db.Column(db.Date, primary_key=True)
@@ -0,0 +1,115 @@
+import random
+import sqlite3
+import time
+from functools import wraps
+
+import click
+from flask import current_app, g, has_request_context, session
+from flask.cli import with_appcontext
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+
+REPLICA_BIND_PREFIX = 'replica_'
+
+
+def replica_binds(urls):
+    """Turn a comma separated list of replica URLs into SQLALCHEMY_BINDS entries."""
+    urls = [url.strip() for url in (urls or '').split(',') if url.strip()]
+    return {f'{REPLICA_BIND_PREFIX}{i}': url for i, url in enumerate(urls)}
+
+
+def _request_replica():
+    """Bind key of the replica chosen for the current request, or None to use the primary."""
+    return g.get('db_replica') if has_request_context() else None
+
+
+class RoutingSession(Session):
+    """Session sending reads of read-only routes to a replica.
+
+    Everything else - writes, flushes and all other routes - uses the primary
+    database (DATABASE_URL). All queries of a request go to the same replica,
+    so a page never mixes data from replicas with different lag.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        engine = super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+        replica = _request_replica()
+        if bind is None and not self._flushing and replica is not None:
+            engines = self._db.engines
+            # Only queries that would go to the primary are rerouted
+            if engine is engines.get(None):
+                return engines[replica]
+
+        return engine
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _remember_write(db_session, flush_context):
+    if has_request_context():
+        g.db_wrote = True
+
+
+def read_only(view):
+    """Mark a view as read-only, so its queries may be served by a replica.
+
+    Users who wrote something within the last DB_REPLICA_LAG_TOLERANCE seconds
+    stay on the primary, so they always see their own changes.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        last_write = session.get('db_last_write', 0)
+        tolerance = current_app.config['DB_REPLICA_LAG_TOLERANCE']
+        if time.time() - last_write > tolerance:
+            replicas = [key for key in current_app.extensions['sqlalchemy'].engines
+                        if key and key.startswith(REPLICA_BIND_PREFIX)]
+            # One replica for the whole request, picked at random to spread the load
+            g.db_replica = random.choice(replicas) if replicas else None
+        return view(*args, **kwargs)
+
+    return wrapper
+
+
+def remember_last_write(response):
+    # Registered as after_request - starts the read-your-writes window
+    if g.get('db_wrote'):
+        session['db_last_write'] = time.time()
+    return response
+
+
+def _sqlite_path(engine):
+    url = engine.url
+    if url.get_backend_name() != 'sqlite' or not url.database or url.database == ':memory:':
+        return None
+    return url.database
+
+
+@click.command('sync-replicas')
+@with_appcontext
+def sync_replicas():
+    """Copy the primary SQLite database into the SQLite replica files.
+
+    Local stand-in for replication when testing with two SQLite files.
+    """
+    from . import db
+
+    # Engine URLs, because Flask-SQLAlchemy resolves relative SQLite paths to the instance folder
+    primary = _sqlite_path(db.engines[None])
+    if primary is None:
+        raise click.ClickException('sync-replicas works only with a SQLite DATABASE_URL.')
+
+    for key, engine in db.engines.items():
+        if not key or not key.startswith(REPLICA_BIND_PREFIX):
+            continue
+        replica = _sqlite_path(engine)
+        if replica is None:
+            click.echo(f'Skipping {key}: not a SQLite file.')
+            continue
+
+        source = sqlite3.connect(primary)
+        target = sqlite3.connect(replica)
+        with target:
+            source.backup(target)
+        source.close()
+        target.close()
+        click.echo(f'Copied {primary} -> {replica}')
@@ -0,0 +1,171 @@
+import hashlib
+import logging
+import os
+import queue
+import shutil
+import tempfile
+import threading
+from abc import ABC, abstractmethod
+
+# Size of the pieces we read/write, so no file is ever kept whole in memory
+CHUNK_SIZE = 64 * 1024
+
+THUMBNAIL_SIZE = (320, 320)
+IMAGE_TYPES = ('image/jpeg', 'image/png', 'image/gif', 'image/webp')
+
+
+class BlobStore(ABC):
+    """Interface for attachment storage.
+
+    Blobs are content-addressed: the key is the SHA-256 of the content, so the
+    same file uploaded twice is stored only once. A local disk implementation
+    is provided below; an S3-compatible one only needs to implement the same
+    methods (e.g. with multipart uploads and ranged GETs) - a store missing
+    one of them can't be created.
+    """
+
+    @abstractmethod
+    def save(self, stream):
+        """Store data read from a file-like object, return (key, size)."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def open(self, key):
+        """Return a binary file-like object for reading the blob."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def exists(self, key):
+        raise NotImplementedError
+
+    def path(self, key):
+        """Local filesystem path of the blob, or None if the store is remote."""
+        return None
+
+    @abstractmethod
+    def save_thumbnail(self, key, stream):
+        raise NotImplementedError
+
+    @abstractmethod
+    def open_thumbnail(self, key):
+        raise NotImplementedError
+
+    def thumbnail_path(self, key):
+        return None
+
+
+class LocalBlobStore(BlobStore):
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(os.path.join(root, 'tmp'), exist_ok=True)
+
+    def _blob_path(self, key, kind='blobs'):
+        # Two levels of sharding so one directory never holds too many files
+        return os.path.join(self.root, kind, key[:2], key[2:4], key)
+
+    def save(self, stream):
+        digest = hashlib.sha256()
+        size = 0
+
+        # Write to a temporary file while hashing, then move it into place
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.join(self.root, 'tmp'))
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                while True:
+                    chunk = stream.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    digest.update(chunk)
+                    tmp.write(chunk)
+                    size += len(chunk)
+
+            key = digest.hexdigest()
+            final_path = self._blob_path(key)
+            if os.path.exists(final_path):
+                # Same content already stored - deduplicate
+                os.remove(tmp_path)
+            else:
+                os.makedirs(os.path.dirname(final_path), exist_ok=True)
+                os.replace(tmp_path, final_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        return key, size
+
+    def open(self, key):
+        return open(self._blob_path(key), 'rb')
+
+    def exists(self, key):
+        return os.path.exists(self._blob_path(key))
+
+    def path(self, key):
+        return self._blob_path(key)
+
+    def save_thumbnail(self, key, stream):
+        final_path = self._blob_path(key, 'thumbs')
+        os.makedirs(os.path.dirname(final_path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.join(self.root, 'tmp'))
+        with os.fdopen(fd, 'wb') as tmp:
+            shutil.copyfileobj(stream, tmp, CHUNK_SIZE)
+        os.replace(tmp_path, final_path)
+
+    def open_thumbnail(self, key):
+        return open(self._blob_path(key, 'thumbs'), 'rb')
+
+    def thumbnail_path(self, key):
+        path = self._blob_path(key, 'thumbs')
+        return path if os.path.exists(path) else None
+
+
+class ThumbnailWorker:
+    """Background thread generating thumbnails for uploaded images.
+
+    Uploads only enqueue the blob key, so the request returns as soon as the
+    file is stored.
+    """
+
+    def __init__(self, store, logger=None):
+        self.store = store
+        # The thread runs outside of the app context, so it gets the logger up front
+        self.logger = logger or logging.getLogger(__name__)
+        self.jobs = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, key, content_type):
+        if content_type not in IMAGE_TYPES:
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+        self.jobs.put(key)
+
+    def _run(self):
+        while True:
+            key = self.jobs.get()
+            try:
+                self._make_thumbnail(key)
+            except Exception:
+                # A broken image must not stop the worker, but we want to know about it
+                self.logger.exception('Thumbnail generation failed for blob %s', key)
+            finally:
+                self.jobs.task_done()
+
+    def _make_thumbnail(self, key):
+        from io import BytesIO
+        from PIL import Image
+
+        if self.store.thumbnail_path(key):
+            return
+
+        with self.store.open(key) as blob:
+            image = Image.open(blob)
+            image.thumbnail(THUMBNAIL_SIZE)
+            output = BytesIO()
+            image.convert('RGB').save(output, 'JPEG', quality=80)
+
+        output.seek(0)
+        self.store.save_thumbnail(key, output)
@@ -0,0 +1,156 @@
+import click
+from flask.cli import with_appcontext
+
+from . import db
+from .models import (Project, Offer, Application, Rating, DailyStat, RollupState, RollupDirtyDay, ArchivedProject,
+                     ArchivedOffer, ArchivedApplication, ArchivedRating, ArchivedAttachment)
+
+# One step per change that touched the schema, in the order the changes were made.
+# Every step checks what is already there, so each can run any number of times.
+STEPS = []
+
+
+def step(change):
+    def register(function):
+        STEPS.append((change, function))
+        return function
+    return register
+
+
+def _add_column(connection, table, column, ddl):
+    existing = {c['name'] for c in db.inspect(connection).get_columns(table)}
+    if column not in existing:
+        connection.execute(db.text(f'ALTER TABLE {table} ADD COLUMN {column} {ddl}'))
+        click.echo(f'Added {table}.{column}')
+
+
+def _add_indexes(connection, *columns):
+    """Create the indexes the models declare (index=True) on these columns, if missing."""
+    for column in columns:
+        existing = {i['name'] for i in db.inspect(connection).get_indexes(column.table.name)}
+        for index in column.table.indexes:
+            if column.name in index.columns and index.name not in existing:
+                index.create(connection)
+                click.echo(f'Added index {index.name}')
+
+
+def _add_tables(connection, *models):
+    """Create missing tables; for tables that exist, add the indexes they lack."""
+    for model in models:
+        table = model.__table__
+        if db.inspect(connection).has_table(table.name):
+            _add_indexes(connection, *table.columns)
+        else:
+            table.create(connection)
+            click.echo(f'Added table {table.name}')
+
+
+@step('attachment blob store')
+def _attachment_blobs(connection):
+    _add_column(connection, 'attachments', 'blob_key', 'VARCHAR(64)')
+    _add_column(connection, 'attachments', 'content_type', 'VARCHAR(100)')
+    _add_column(connection, 'attachments', 'size', 'INTEGER')
+
+
+UNIQUE_APPLICATION = 'uq_application_offer_applicant'
+
+
+def _merge_duplicate_applications(connection):
+    """Keep one application per (offer, applicant) - the accepted one if there is one, else the oldest."""
+    duplicates = connection.execute(db.text(
+        'SELECT offer_id, applicant_id FROM applications GROUP BY offer_id, applicant_id HAVING COUNT(*) > 1'
+    )).all()
+
+    for offer_id, applicant_id in duplicates:
+        ids = connection.execute(db.text(
+            "SELECT id FROM applications WHERE offer_id = :offer AND applicant_id = :applicant "
+            "ORDER BY CASE WHEN status = 'accepted' THEN 0 ELSE 1 END, id"
+        ), {'offer': offer_id, 'applicant': applicant_id}).scalars().all()
+        keep, remove = ids[0], ids[1:]
+
+        # Ratings of the removed applications move to the one we keep
+        for application_id in remove:
+            connection.execute(db.text('UPDATE ratings SET application_id = :keep WHERE application_id = :old'),
+                               {'keep': keep, 'old': application_id})
+            connection.execute(db.text('DELETE FROM applications WHERE id = :old'), {'old': application_id})
+
+    return len(duplicates)
+
+
+@step('concurrency-safe applications')
+def _safe_applications(connection):
+    # Existing rows start at version 1 (the column default)
+    _add_column(connection, 'offers', 'version_id', 'INTEGER NOT NULL DEFAULT 1')
+    _add_column(connection, 'applications', 'version_id', 'INTEGER NOT NULL DEFAULT 1')
+
+    merged = _merge_duplicate_applications(connection)
+    if merged:
+        click.echo(f'Merged duplicate applications of {merged} (offer, applicant) pair(s)')
+
+    inspector = db.inspect(connection)
+    unique = {c['name'] for c in inspector.get_unique_constraints('applications')}
+    unique |= {i['name'] for i in inspector.get_indexes('applications') if i['unique']}
+    if UNIQUE_APPLICATION not in unique:
+        if connection.dialect.name == 'sqlite':
+            # SQLite can't add constraints to an existing table - a unique index does the same
+            connection.execute(db.text(
+                f'CREATE UNIQUE INDEX {UNIQUE_APPLICATION} ON applications (offer_id, applicant_id)'))
+        else:
+            connection.execute(db.text(
+                f'ALTER TABLE applications ADD CONSTRAINT {UNIQUE_APPLICATION} UNIQUE (offer_id, applicant_id)'))
+        click.echo(f'Added {UNIQUE_APPLICATION}')
+
+
+@step('updated_at for ETags')
+def _updated_at(connection):
+    for table in ('offers', 'applications', 'projects'):
+        _add_column(connection, table, 'updated_at', 'TIMESTAMP')
+
+    # Best known values for existing rows
+    connection.execute(db.text('UPDATE offers SET updated_at = date_created WHERE updated_at IS NULL'))
+    connection.execute(db.text('UPDATE applications SET updated_at = date_created WHERE updated_at IS NULL'))
+    connection.execute(db.text(
+        'UPDATE projects SET updated_at = COALESCE(date_finished, date_created) WHERE updated_at IS NULL'))
+
+
+@step('analytics rollups')
+def _analytics(connection):
+    _add_column(connection, 'offers', 'date_approved', 'TIMESTAMP')
+    _add_column(connection, 'ratings', 'date_created', 'TIMESTAMP')
+
+    # The approval moment of old offers is unknown - the creation date is the closest we have
+    connection.execute(db.text(
+        "UPDATE offers SET date_approved = date_created WHERE date_approved IS NULL AND status IN ('approved', 'closed')"))
+    connection.execute(db.text(
+        'UPDATE ratings SET date_created = (SELECT applications.date_created FROM applications '
+        'WHERE applications.id = ratings.application_id) WHERE date_created IS NULL'))
+
+    _add_tables(connection, DailyStat, RollupState, RollupDirtyDay)
+    # Dates the rollups look rows up by
+    _add_indexes(connection, Offer.__table__.c.date_created, Offer.__table__.c.date_approved,
+                 Offer.__table__.c.updated_at, Application.__table__.c.date_created,
+                 Application.__table__.c.updated_at, Rating.__table__.c.date_created)
+
+
+@step('archive')
+def _archive(connection):
+    # Parents first (foreign keys)
+    _add_tables(connection, ArchivedProject, ArchivedOffer, ArchivedApplication, ArchivedRating, ArchivedAttachment)
+    # The archiver looks live rows up by status
+    _add_indexes(connection, Project.__table__.c.status, Offer.__table__.c.status)
+
+
+def upgrade_database():
+    """Bring an existing database up to the current models. Safe to run more than once."""
+    # One transaction - a failing step leaves the database as it was
+    with db.engine.begin() as connection:
+        for change, function in STEPS:
+            function(connection)
+
+
+@click.command('upgrade-db')
+@with_appcontext
+def upgrade_db():
+    """Add the columns, constraints and indexes introduced since the first release to an existing database."""
+    upgrade_database()
+    click.echo('Database is up to date.')
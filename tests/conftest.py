@@ -0,0 +1,67 @@
+import pytest
+
+from src import create_app, db
+from src.models import Administrator, Beneficient, Donor, Offer, OrganizationWorker, Project
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    # A SQLite file (not :memory:), so every thread gets its own connection to the same data
+    monkeypatch.setenv('DATABASE_URL', 'sqlite:///' + str(tmp_path / 'test.db'))
+    monkeypatch.setenv('SECRET_KEY', 'test')
+    monkeypatch.setenv('UPLOAD_FOLDER', str(tmp_path / 'uploads'))
+    monkeypatch.delenv('DATABASE_REPLICA_URLS', raising=False)
+
+    app = create_app()
+    app.config['TESTING'] = True
+
+    with app.app_context():
+        db.create_all()
+        worker = OrganizationWorker(email='worker@test.pl', first_name='w', last_name='w', is_approved=True)
+        donor = Donor(email='donor@test.pl', first_name='d', last_name='d', is_approved=True)
+        admin = Administrator(email='admin@test.pl', first_name='a', last_name='a', is_approved=True)
+        for user in (worker, donor, admin):
+            user.set_password('secret')
+            db.session.add(user)
+        db.session.commit()
+
+        project = Project(title='Project', description='desc', worker_id=worker.id)
+        db.session.add(project)
+        db.session.commit()
+
+        db.session.add(Offer(title='Offer', description='desc', offer_type='food',
+                             donor_id=donor.id, project_id=project.id, status='approved'))
+        db.session.commit()
+
+    yield app
+
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+
+@pytest.fixture
+def add_beneficiaries(app):
+    def add(count):
+        emails = []
+        with app.app_context():
+            for i in range(count):
+                user = Beneficient(email=f'ben{i}@test.pl', first_name='b', last_name='b', is_approved=True)
+                user.set_password('secret')
+                db.session.add(user)
+                emails.append(user.email)
+            db.session.commit()
+        return emails
+
+    return add
+
+
+@pytest.fixture
+def login(app):
+    def login(email):
+        client = app.test_client()
+        response = client.post('/auth/login', data={'email': email, 'password': 'secret'})
+        assert response.status_code == 302
+        return client
+
+    return login
@@ -0,0 +1,43 @@
+from datetime import datetime, timedelta
+
+from src import db
+from src.analytics import run_rollup, project_stats, weekly_stats
+from src.models import Application, DailyStat, Offer, Project
+
+
+def test_moving_an_offer_moves_its_applications_in_the_stats(app, add_beneficiaries, login):
+    login(add_beneficiaries(1)[0]).post('/offer/1/apply', data={'message': 'help'})
+    with app.app_context():
+        # Sent two days ago, so only the move below is newer than the next watermark
+        two_days_ago = datetime.utcnow() - timedelta(days=2)
+        db.session.execute(db.update(Application).values(date_created=two_days_ago, updated_at=two_days_ago))
+        db.session.execute(db.update(Offer).values(updated_at=two_days_ago))
+        db.session.add(Project(title='Other', description='desc', worker_id=1))
+        db.session.commit()
+        run_rollup()
+        assert {row['project_id']: row['applications_created'] for row in project_stats()}[1] == 1
+
+    login('donor@test.pl').post('/offer/1/edit', data={'title': 'Offer', 'description': 'desc',
+                                                       'type': 'food', 'project_id': '2'})
+
+    with app.app_context():
+        run_rollup()
+        applications = {row['project_id']: row['applications_created'] for row in project_stats()}
+        assert applications.get(1, 0) == 0
+        assert applications[2] == 1
+
+
+def test_weekly_stats_uses_utc_days_and_skips_days_outside_the_window(app):
+    today = datetime.utcnow().date()
+    with app.app_context():
+        db.session.add(DailyStat(day=today, project_id=1, offers_created=2))
+        # Next week's row (e.g. written by a host whose clock is ahead) must not break the page
+        db.session.add(DailyStat(day=today + timedelta(days=7), project_id=1, offers_created=5))
+        db.session.commit()
+
+        weeks = weekly_stats(4)
+
+    assert len(weeks) == 4
+    assert weeks[-1]['week'] == today - timedelta(days=today.weekday())
+    assert weeks[-1]['offers_created'] == 2
+    assert sum(week['offers_created'] for week in weeks) == 2
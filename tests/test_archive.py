@@ -0,0 +1,59 @@
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy.exc import OperationalError
+
+from src import archive, db
+from src.models import ArchivedRating, Project, Rating
+
+
+def finish_project_long_ago(app, login):
+    beneficiary = login('ben0@test.pl')
+    beneficiary.post('/offer/1/apply', data={'message': 'help'})
+    login('donor@test.pl').post('/application/1/accept')
+    login('worker@test.pl').post('/worker/src/1/finish')
+    with app.app_context():
+        db.session.get(Project, 1).date_finished = datetime.utcnow() - timedelta(days=40)
+        db.session.commit()
+
+
+def test_rating_added_during_archiving_is_archived_too(app, add_beneficiaries, login, monkeypatch):
+    add_beneficiaries(1)
+    finish_project_long_ago(app, login)
+    worker = login('worker@test.pl')
+
+    lock = archive._lock
+    rated = []
+
+    def lock_then_rate(model, condition):
+        ids = lock(model, condition)
+        if not rated and model.__name__ == 'Application':
+            # The worker rates the donor after the archiver has read the applications
+            other = threading.Thread(target=lambda: rated.append(
+                worker.post('/rate/1', data={'score': '5', 'comment': 'late'}).status_code))
+            other.start()
+            other.join()
+        return ids
+
+    monkeypatch.setattr(archive, '_lock', lock_then_rate)
+    with app.app_context():
+        assert archive.archive_finished() == (1, 1, 0)
+
+    assert rated == [302]
+    with app.app_context():
+        assert Rating.query.count() == 0
+        assert [rating.comment for rating in ArchivedRating.query] == ['late']
+
+
+def test_failed_batch_is_skipped(app, add_beneficiaries, login, monkeypatch):
+    add_beneficiaries(1)
+    finish_project_long_ago(app, login)
+
+    def broken_copy(*args):
+        raise OperationalError('INSERT', {}, Exception('disk I/O error'))
+
+    monkeypatch.setattr(archive, '_copy', broken_copy)
+    with app.app_context():
+        assert archive.archive_finished() == (0, 0, 1)
+        # Still live - the next run tries again
+        assert db.session.get(Project, 1) is not None
@@ -0,0 +1,148 @@
+import threading
+from contextlib import contextmanager
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from src import db
+from src.models import Application, Offer, Project
+
+
+def hammer(requests):
+    """Run all requests at once from separate threads, return their status codes."""
+    barrier = threading.Barrier(len(requests))
+    results = [None] * len(requests)
+    errors = []
+
+    def run(i, request):
+        try:
+            barrier.wait()
+            results[i] = request().status_code
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=run, args=(i, request)) for i, request in enumerate(requests)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not errors
+    return results
+
+
+def test_parallel_applications_create_one_application_per_user(app, add_beneficiaries, login):
+    emails = add_beneficiaries(6)
+    # Every beneficiary sends the same application from 3 clients at once
+    clients = [login(email) for email in emails for _ in range(3)]
+
+    results = hammer([lambda c=c: c.post('/offer/1/apply', data={'message': 'help'}) for c in clients])
+
+    assert results == [302] * len(clients)
+    with app.app_context():
+        per_applicant = db.session.execute(
+            db.select(Application.applicant_id, db.func.count(Application.id))
+            .where(Application.offer_id == 1).group_by(Application.applicant_id)
+        ).all()
+        assert len(per_applicant) == len(emails)
+        assert all(count == 1 for _, count in per_applicant)
+
+
+def test_parallel_accepts_accept_exactly_one_application(app, add_beneficiaries, login):
+    for email in add_beneficiaries(6):
+        login(email).post('/offer/1/apply', data={'message': 'help'})
+
+    # The donor clicks "accept" on different applications from 12 clients at once
+    donors = [login('donor@test.pl') for _ in range(12)]
+    results = hammer([lambda c=c, i=i: c.post(f'/application/{i % 6 + 1}/accept')
+                      for i, c in enumerate(donors)])
+
+    assert results == [302] * len(donors)
+    with app.app_context():
+        statuses = [application.status for application in Application.query.filter_by(offer_id=1)]
+        assert statuses.count('accepted') == 1
+        assert statuses.count('rejected') == 5
+        assert db.session.get(Offer, 1).status == 'closed'
+
+
+def test_applications_racing_with_accept_stay_consistent(app, add_beneficiaries, login):
+    emails = add_beneficiaries(10)
+    for email in emails[:2]:
+        login(email).post('/offer/1/apply', data={'message': 'help'})
+
+    # Late applications arrive while the donor accepts one of the first ones
+    requests = [lambda c=login(email): c.post('/offer/1/apply', data={'message': 'help'}) for email in emails[2:]]
+    requests += [lambda c=login('donor@test.pl'): c.post('/application/1/accept') for _ in range(4)]
+
+    assert hammer(requests) == [302] * len(requests)
+
+    with app.app_context():
+        applications = Application.query.filter_by(offer_id=1).all()
+        assert [a.status for a in applications].count('accepted') == 1
+        # Nothing stays pending on a closed offer: it was either rejected or never created
+        assert all(a.status in ('accepted', 'rejected') for a in applications)
+        assert db.session.get(Offer, 1).status == 'closed'
+
+
+@contextmanager
+def application_before_offer_flush(client):
+    """Make `client` apply for offer 1 right before this thread first flushes a changed offer,
+    i.e. between the writer reading the offer and writing it back."""
+    thread = threading.current_thread()
+    results = []
+
+    def before_flush(session, flush_context, instances):
+        if threading.current_thread() is not thread or results:
+            return
+        if any(isinstance(obj, Offer) for obj in session.dirty):
+            other = threading.Thread(target=lambda: results.append(
+                client.post('/offer/1/apply', data={'message': 'help'}).status_code))
+            other.start()
+            other.join()
+
+    event.listen(Session, 'before_flush', before_flush)
+    try:
+        yield results
+    finally:
+        event.remove(Session, 'before_flush', before_flush)
+
+
+def test_edit_offer_retries_when_an_application_arrives(app, add_beneficiaries, login):
+    beneficiary = login(add_beneficiaries(1)[0])
+    donor = login('donor@test.pl')
+
+    with application_before_offer_flush(beneficiary) as applied:
+        response = donor.post('/offer/1/edit', data={'title': 'Edited', 'description': 'new',
+                                                     'type': 'food', 'project_id': '1'})
+
+    assert applied == [302]
+    assert response.status_code == 302
+    with app.app_context():
+        assert db.session.get(Offer, 1).title == 'Edited'
+        assert Application.query.filter_by(offer_id=1).count() == 1
+
+
+def test_finish_project_retries_when_an_application_arrives(app, add_beneficiaries, login):
+    beneficiary = login(add_beneficiaries(1)[0])
+    worker = login('worker@test.pl')
+
+    with application_before_offer_flush(beneficiary) as applied:
+        response = worker.post('/worker/src/1/finish')
+
+    assert applied == [302]
+    assert response.status_code == 302
+    with app.app_context():
+        assert db.session.get(Project, 1).status == 'finished'
+        assert db.session.get(Offer, 1).status == 'closed'
+        assert Application.query.filter_by(offer_id=1).count() == 1
+
+
+def test_duplicate_application_does_not_change_the_offer(app, add_beneficiaries, login):
+    beneficiary = login(add_beneficiaries(1)[0])
+    beneficiary.post('/offer/1/apply', data={'message': 'help'})
+    with app.app_context():
+        version = db.session.get(Offer, 1).version_id
+
+    assert beneficiary.post('/offer/1/apply', data={'message': 'again'}).status_code == 302
+    with app.app_context():
+        assert db.session.get(Offer, 1).version_id == version